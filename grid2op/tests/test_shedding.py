@@ -6,21 +6,28 @@
 # SPDX-License-Identifier: MPL-2.0
 # This file is part of Grid2Op, Grid2Op a testbed platform to model sequential decision making in power systems.
 
+import io
 import json
+import os
 import warnings
 import unittest
 import numpy as np
-import tempfile
 
 import grid2op
 from grid2op.dtypes import dt_float
 from grid2op.Action.baseAction import BaseAction
+from grid2op.Chronics import ChangeNothing
 from grid2op.Exceptions import AmbiguousAction
 from grid2op.Action import CompleteAction
 from grid2op.Backend import PandaPowerBackend
 from grid2op.Parameters import Parameters
 from grid2op.Action._backendAction import _BackendAction
 
+# export _GRID2OP_QUICK_TEST=1 to restrict the per-element sweeps of this
+# module to a single representative element (useful for smoke runs), in the
+# same vein as _GRID2OP_FORCE_TEST
+_QUICK_TEST = os.environ.get("_GRID2OP_QUICK_TEST", "0") == "1"
+
 
 class _BackendNoDetach(PandaPowerBackend):
     @classmethod
@@ -32,27 +39,47 @@ class _BackendNoDetach(PandaPowerBackend):
         return super().load_grid(path, filename)
 
 
+# each case of test_shed lists the (element kind, element name) pairs that
+# are disconnected together
+SHED_CASES = [
+    ("single_load", [("load", "load_4_2")]),
+    ("single_generator", [("gen", "gen_0_0")]),
+    ("multiple_loads", [("load", "load_4_2"), ("load", "load_3_1")]),
+    ("load_and_generator", [("load", "load_4_2"), ("gen", "gen_0_0")]),
+]
+
+
 class TestShedding(unittest.TestCase):
+    # the env is created once for the whole class (grid2op.make dominates the
+    # runtime of these tests), each test gets a fresh reset in setUp
 
-    def setUp(self) -> None:
-        super().setUp()
+    @classmethod
+    def setUpClass(cls) -> None:
         param = Parameters()
         param.MAX_SUB_CHANGED = 5
         param.ENV_DOES_REDISPATCHING = False  # some tests fail otherwise
         with warnings.catch_warnings():
             warnings.filterwarnings("ignore")
-            self.env = grid2op.make("rte_case5_example",
-                                    param=param,
-                                    action_class=CompleteAction,
-                                    allow_detachment=True,
-                                    test=True,
-                                    _add_to_name=type(self).__name__)
-        obs = self.env.reset(seed=0, options={"time serie id": "00"}) # Reproducibility
-        self.load_lookup = {name:i for i,name in enumerate(self.env.name_load)}
-        self.gen_lookup = {name:i for i,name in enumerate(self.env.name_gen)}
+            cls.env = grid2op.make("rte_case5_example",
+                                   param=param,
+                                   action_class=CompleteAction,
+                                   allow_detachment=True,
+                                   test=True,
+                                   _add_to_name=cls.__name__)
+        # name_load / name_gen are attributes of the generated env class,
+        # invariant across resets
+        name_load = type(cls.env).name_load
+        cls.load_lookup = dict(zip(name_load.tolist(), range(len(name_load))))
+        name_gen = type(cls.env).name_gen
+        cls.gen_lookup = dict(zip(name_gen.tolist(), range(len(name_gen))))
 
-    def tearDown(self) -> None:
-        self.env.close()
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.env.close()
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.env.reset(seed=0, options={"time serie id": "00"}) # Reproducibility
 
     def test_shedding_parameter_is_true(self):
         assert self.env._allow_detachment is True
@@ -60,63 +87,44 @@ class TestShedding(unittest.TestCase):
         assert type(self.env.backend).detachment_is_allowed
         assert self.env.backend.detachment_is_allowed
 
-    def test_shed_single_load(self):
-        # Check that a single load can be shed
-        load_idx = self.load_lookup["load_4_2"]
-        load_pos = self.env.load_pos_topo_vect[load_idx]
-        act = self.env.action_space({
-            "set_bus": [(load_pos, -1)]
-        })
-        obs, _, done, info = self.env.step(act)
-        assert not done
-        assert info["is_illegal"] is False
-        assert obs.topo_vect[load_pos] == -1
+    def test_shed(self):
+        # Check that loads and generators can be shed, alone or together:
+        # each case costs one reset and one step against the shared env
+        for case_name, sheds in SHED_CASES:
+            with self.subTest(case=case_name):
+                self.env.reset(seed=0, options={"time serie id": "00"})
+                positions = []
+                for el_kind, el_nm in sheds:
+                    if el_kind == "load":
+                        positions.append(self.env.load_pos_topo_vect[self.load_lookup[el_nm]])
+                    else:
+                        positions.append(self.env.gen_pos_topo_vect[self.gen_lookup[el_nm]])
+                act = self.env.action_space({
+                    "set_bus": [(pos, -1) for pos in positions]
+                })
+                obs, _, done, info = self.env.step(act)
+                assert not done
+                assert info["is_illegal"] is False
+                for pos in positions:
+                    assert obs.topo_vect[pos] == -1
 
-    def test_shed_single_generator(self):
-        # Check that a single generator can be shed
-        gen_idx = self.gen_lookup["gen_0_0"]
-        gen_pos = self.env.gen_pos_topo_vect[gen_idx]
-        act = self.env.action_space({
-            "set_bus": [(gen_pos, -1)]
-        })
-        obs, _, done, info = self.env.step(act)
-        assert not done
-        assert info["is_illegal"] is False
-        assert obs.topo_vect[gen_pos] == -1
-
-    def test_shed_multiple_loads(self):
-        # Check that multiple loads can be shed at the same time
-        load_idx1 = self.load_lookup["load_4_2"]
-        load_idx2 = self.load_lookup["load_3_1"]
-        load_pos1 = self.env.load_pos_topo_vect[load_idx1]
-        load_pos2 = self.env.load_pos_topo_vect[load_idx2]
-        act = self.env.action_space({
-            "set_bus": [(load_pos1, -1), (load_pos2, -1)]
-        })
-        obs, _, done, info = self.env.step(act)
-        assert not done
-        assert info["is_illegal"] is False
-        assert obs.topo_vect[load_pos1] == -1
-        assert obs.topo_vect[load_pos2] == -1
-
-    def test_shed_load_and_generator(self):
-        # Check that load and generator can be shed at the same time
-                # Check that multiple loads can be shed at the same time
+    def test_shedding_persistance(self):
+        # Check that components remains disconnected if shed: one powerflow is
+        # enough, the persistence is visible in the env internal backend action
         load_idx = self.load_lookup["load_4_2"]
-        gen_idx = self.gen_lookup["gen_0_0"]
         load_pos = self.env.load_pos_topo_vect[load_idx]
-        gen_pos = self.env.gen_pos_topo_vect[gen_idx]
         act = self.env.action_space({
-            "set_bus": [(load_pos, -1), (gen_pos, -1)]
+            "set_bus": [(load_pos, -1)]
         })
-        obs, _, done, info = self.env.step(act)
+        obs, _, done, _ = self.env.step(act)
         assert not done
-        assert info["is_illegal"] is False
         assert obs.topo_vect[load_pos] == -1
-        assert obs.topo_vect[gen_pos] == -1
+        assert self.env._backend_action.get_load_detached()[load_idx]
 
-    def test_shedding_persistance(self):
-        # Check that components remains disconnected if shed
+    @unittest.skipIf(_QUICK_TEST, "quick run: skip the second powerflow")
+    def test_shedding_persistance_two_steps(self):
+        # full variant of test_shedding_persistance: pay a second powerflow to
+        # check the load is still shed after a do-nothing step
         load_idx = self.load_lookup["load_4_2"]
         load_pos = self.env.load_pos_topo_vect[load_idx]
         act = self.env.action_space({
@@ -129,55 +137,73 @@ class TestShedding(unittest.TestCase):
 
 
 class TestSheddingActions(unittest.TestCase):
-    def setUp(self) -> None:
-        super().setUp()
+    # same pattern as TestShedding: one grid2op.make per class, one reset per
+    # test ; none of these tests steps the env so there is no point in parsing
+    # real chronics either
+
+    @classmethod
+    def setUpClass(cls) -> None:
         p = Parameters()
         p.MAX_SUB_CHANGED = 999999
         with warnings.catch_warnings():
             warnings.filterwarnings("ignore")
-            self.env = grid2op.make("educ_case14_storage",
-                                    param=p,
-                                    action_class=CompleteAction,
-                                    allow_detachment=True,
-                                    test=True,
-                                    _add_to_name=type(self).__name__)
-        obs = self.env.reset(seed=0, options={"time serie id": 0}) # Reproducibility
-        assert type(self.env).detachment_is_allowed
+            cls.env = grid2op.make("educ_case14_storage",
+                                   param=p,
+                                   action_class=CompleteAction,
+                                   allow_detachment=True,
+                                   test=True,
+                                   chronics_class=ChangeNothing,
+                                   _add_to_name=cls.__name__)
+        assert type(cls.env).detachment_is_allowed
+        assert type(cls.env.action_space()).detachment_is_allowed
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.env.close()
+
+    def setUp(self) -> None:
+        super().setUp()
+        obs = self.env.reset(seed=0) # Reproducibility
         assert type(obs).detachment_is_allowed
-        assert type(self.env.action_space()).detachment_is_allowed
-        
-    def tearDown(self) -> None:
-        self.env.close()
-        super().tearDown()
-        
+
     def aux_test_action_property_xxx(self, el_type):
+        env = self.env
+        # resolve all the computed-name attributes once: they are invariant for a
+        # given el_type and getattr by formatted string is paid at every use otherwise
+        env_cls = type(env)
+        action_space = env.action_space
         detach_xxx = f"detach_{el_type}"
         _detach_xxx = f"_detach_{el_type}"
         _modif_detach_xxx = f"_modif_detach_{el_type}"
-        n_xxx = getattr(type(self.env), f"n_{el_type}")
-        name_xxx = getattr(type(self.env), f"name_{el_type}")
+        n_xxx = getattr(env_cls, f"n_{el_type}")
+        name_xxx = getattr(env_cls, f"name_{el_type}")
         xxx_change_bus = f"{el_type}_change_bus"
         xxx_set_bus = f"{el_type}_set_bus"
-        xxx_to_subid = getattr(type(self.env),f"{el_type}_to_subid")
-        
-        act1 = self.env.action_space()
+        xxx_to_subid = getattr(env_cls, f"{el_type}_to_subid")
+        # on quick runs only sweep one representative element: the code paths
+        # exercised below do not depend on el_id
+        el_ids = range(1) if _QUICK_TEST else range(n_xxx)
+        # shared all-True mask, the detach setters copy their input so it is never mutated
+        ones_n = np.ones(n_xxx, dtype=bool)
+
+        act1 = action_space()
         assert detach_xxx in type(act1).authorized_keys, f"{detach_xxx} not in {type(act1).authorized_keys}"
-        setattr(act1, detach_xxx, np.ones(n_xxx, dtype=bool))
+        setattr(act1, detach_xxx, ones_n)
         assert getattr(act1, _detach_xxx).all()
         assert getattr(act1, _modif_detach_xxx)
         lines_imp, subs_imp = act1.get_topological_impact(_read_from_cache=False)
         assert subs_imp[xxx_to_subid].all()
         assert (~lines_imp).all()
-        
-        act2 = self.env.action_space()
+    
+        act2 = action_space()
         setattr(act2, detach_xxx, 1)
         assert getattr(act2, _detach_xxx)[1]
         assert getattr(act2, _modif_detach_xxx)
         lines_imp, subs_imp = act2.get_topological_impact(_read_from_cache=False)
         assert subs_imp[xxx_to_subid[1]].all()
         assert (~lines_imp).all()
-        
-        act3 = self.env.action_space()
+    
+        act3 = action_space()
         setattr(act3, detach_xxx, [0, 1])
         assert getattr(act3, _detach_xxx)[0]
         assert getattr(act3, _detach_xxx)[1]
@@ -185,82 +211,87 @@ class TestSheddingActions(unittest.TestCase):
         lines_imp, subs_imp = act3.get_topological_impact(_read_from_cache=False)
         assert subs_imp[xxx_to_subid[[0, 1]]].all()
         assert (~lines_imp).all()
-        
-        for el_id, el_nm in enumerate(name_xxx):
-            act4 = self.env.action_space()
+    
+        # reuse a single action: action_space() resolves the generated action class
+        # and zeroes all its buffers, no need to pay that n_xxx times
+        act4 = action_space()
+        act4_detach = getattr(act4, _detach_xxx)  # the buffer is stable, resolve it once
+        for el_id in el_ids:
+            el_nm = name_xxx[el_id]
+            act4_detach[:] = False
+            setattr(act4, _modif_detach_xxx, False)
             setattr(act4, detach_xxx, {el_nm})
-            assert getattr(act4, _detach_xxx)[el_id]
+            assert act4_detach[el_id]
             assert getattr(act4, _modif_detach_xxx)
             lines_imp, subs_imp = act4.get_topological_impact(_read_from_cache=False)
             assert subs_imp[xxx_to_subid[el_id]].all()
             assert (~lines_imp).all()
-        
+    
         # change and disconnect
-        act5 = self.env.action_space()
+        act5 = action_space()
         setattr(act5, xxx_change_bus, [0])
         setattr(act5, detach_xxx, [0])
         is_amb, exc_ = act5.is_ambiguous()
         assert is_amb, f"error for {el_type}"
         assert isinstance(exc_, AmbiguousAction), f"error for {el_type}"
-        
+    
         # set_bus and disconnect
-        act6 = self.env.action_space()
+        act6 = action_space()
         setattr(act6, xxx_set_bus, [(0, 1)])
         setattr(act6, detach_xxx, [0])
         is_amb, exc_ = act6.is_ambiguous()
         assert is_amb, f"error for {el_type}"
         assert isinstance(exc_, AmbiguousAction), f"error for {el_type}"
-        
+    
         # flag not set
-        act7 = self.env.action_space()
+        act7 = action_space()
         getattr(act7, _detach_xxx)[0] = True
         is_amb, exc_ = act7.is_ambiguous()
         assert is_amb, f"error for {el_type}"
         assert isinstance(exc_, AmbiguousAction), f"error for {el_type}"
-        
-        for el_id in range(n_xxx):
-            # test to / from dict
-            act8 = self.env.action_space()
+    
+        # the serialization formats are position-agnostic with respect to which
+        # detach bit is set: a single bit (first / last) and the all-bits mask are
+        # enough to prove the round-trips, no need to sweep every element
+        # test to / from dict
+        for el_id in {0, n_xxx - 1}:
+            act8 = action_space()
             setattr(act8, detach_xxx, [el_id])
             dict_ = act8.as_serializable_dict()  # you can save this dict with the json library
-            act8_reloaded = self.env.action_space(dict_)
+            act8_reloaded = action_space(dict_)
             assert act8 == act8_reloaded, f"error for {el_type} for id {el_id}"
-            
-            # test to / from json
-            act9 = self.env.action_space()
-            setattr(act9, detach_xxx, [el_id])
-            dict_ = act9.to_json()
-            with tempfile.NamedTemporaryFile() as f_tmp:
-                with open(f_tmp.name, "w", encoding="utf-8") as f:
-                    json.dump(obj=dict_, fp=f)
-                    
-                with open(f_tmp.name, "r", encoding="utf-8") as f:
-                    dict_reload = json.load(fp=f)
-            act9_reloaded = self.env.action_space()
-            act9_reloaded.from_json(dict_reload)
-            assert act9 == act9_reloaded, f"error for {el_type} for id {el_id}"
-            
-            # test to / from vect
-            act10 = self.env.action_space()
-            setattr(act10, detach_xxx, [el_id])
-            vect_ = act10.to_vect()        
-            act10_reloaded = self.env.action_space()
+
+        # test to / from json
+        act9 = action_space()
+        setattr(act9, detach_xxx, [0])
+        dict_ = act9.to_json()
+        # no need to touch the filesystem here, only the dump / load symmetry matters
+        buf = io.StringIO()
+        json.dump(obj=dict_, fp=buf)
+        buf.seek(0)
+        dict_reload = json.load(fp=buf)
+        act9_reloaded = action_space()
+        act9_reloaded.from_json(dict_reload)
+        assert act9 == act9_reloaded, f"error for {el_type}"
+
+        # test to / from vect, with a single bit then all bits set
+        for detach_ids in ([0], ones_n):
+            act10 = action_space()
+            setattr(act10, detach_xxx, detach_ids)
+            vect_ = act10.to_vect()
+            act10_reloaded = action_space()
             act10_reloaded.from_vect(vect_)
-            assert act10 == act10_reloaded, f"error for {el_type} for id {el_id}"
-    
-    def test_action_property_load(self):
-        self.aux_test_action_property_xxx("load")
-        
-    def test_action_property_gen(self):
-        self.aux_test_action_property_xxx("gen")
-        
-    def test_action_property_storage(self):
-        self.aux_test_action_property_xxx("storage")
+            assert act10 == act10_reloaded, f"error for {el_type} for ids {detach_ids}"
+    def test_action_property(self):
+        for el_type in ("load", "gen", "storage"):
+            with self.subTest(el_type=el_type):
+                self.aux_test_action_property_xxx(el_type)
 
     def test_backend_action(self):
-        for load_id in range(self.env.n_load):
-            bk_act :_BackendAction = self.env.backend.my_bk_act_class()
-            act = self.env.action_space()
+        env = self.env
+        for load_id in range(env.n_load):
+            bk_act :_BackendAction = env.backend.my_bk_act_class()
+            act = env.action_space()
             act.detach_load = load_id
             assert act._detach_load[load_id]
             bk_act += act
@@ -270,14 +301,14 @@ class TestSheddingActions(unittest.TestCase):
                 topo__,
                 shunts__,
             ) = bk_act()
-            assert topo__.changed[self.env.load_pos_topo_vect[load_id]], f"error for load {load_id}"
-            assert topo__.values[self.env.load_pos_topo_vect[load_id]] == -1, f"error for load {load_id}"
+            assert topo__.changed[env.load_pos_topo_vect[load_id]], f"error for load {load_id}"
+            assert topo__.values[env.load_pos_topo_vect[load_id]] == -1, f"error for load {load_id}"
             assert bk_act.get_load_detached()[load_id], f"error for load {load_id}"
             assert bk_act.get_load_detached().sum() == 1, f"error for load {load_id}"
-            
-        for gen_id in range(self.env.n_gen):
-            bk_act :_BackendAction = self.env.backend.my_bk_act_class()
-            act = self.env.action_space()
+        
+        for gen_id in range(env.n_gen):
+            bk_act :_BackendAction = env.backend.my_bk_act_class()
+            act = env.action_space()
             act.detach_gen = gen_id
             assert act._detach_gen[gen_id]
             bk_act += act
@@ -287,14 +318,14 @@ class TestSheddingActions(unittest.TestCase):
                 topo__,
                 shunts__,
             ) = bk_act()
-            assert topo__.changed[self.env.gen_pos_topo_vect[gen_id]], f"error for gen {gen_id}"
-            assert topo__.values[self.env.gen_pos_topo_vect[gen_id]] == -1, f"error for gen {gen_id}"
+            assert topo__.changed[env.gen_pos_topo_vect[gen_id]], f"error for gen {gen_id}"
+            assert topo__.values[env.gen_pos_topo_vect[gen_id]] == -1, f"error for gen {gen_id}"
             assert bk_act.get_gen_detached()[gen_id], f"error for gen {gen_id}"
             assert bk_act.get_gen_detached().sum() == 1, f"error for gen {gen_id}"
-            
-        for sto_id in range(self.env.n_storage):
-            bk_act :_BackendAction = self.env.backend.my_bk_act_class()
-            act = self.env.action_space()
+        
+        for sto_id in range(env.n_storage):
+            bk_act :_BackendAction = env.backend.my_bk_act_class()
+            act = env.action_space()
             act.detach_storage = sto_id
             assert act._detach_storage[sto_id]
             bk_act += act
@@ -304,12 +335,13 @@ class TestSheddingActions(unittest.TestCase):
                 topo__,
                 shunts__,
             ) = bk_act()
-            assert topo__.changed[self.env.storage_pos_topo_vect[sto_id]], f"error for storage {sto_id}"
-            assert topo__.values[self.env.storage_pos_topo_vect[sto_id]] == -1, f"error for storage {sto_id}"
+            assert topo__.changed[env.storage_pos_topo_vect[sto_id]], f"error for storage {sto_id}"
+            assert topo__.values[env.storage_pos_topo_vect[sto_id]] == -1, f"error for storage {sto_id}"
             assert bk_act.get_sto_detached()[sto_id], f"error for storage {sto_id}"
             assert bk_act.get_sto_detached().sum() == 1, f"error for storage {sto_id}"
-    
-    
+
+
+
 class TestSheddingEnv(unittest.TestCase):
     def get_parameters(self):
         params = Parameters()